@@ -1,92 +1,96 @@
 from dataclasses import dataclass
-from threading import Lock
+from threading import Event, Thread
+from typing import Optional
 
 from rich.console import Console
-from rich.layout import Layout
 from rich.live import Live
-from rich.panel import Panel
 from rich.progress import Progress, BarColumn, TextColumn, TaskID, TaskProgressColumn
 
-from rtcp import get_first_rtcp_app_packet_from_rtcp_data
+from rtcp import get_first_rtcp_app_signal_from_rtcp_data
 from satip import SatIpChannel
 from util import create_logger
 
-BORDER_COLORS = ['bright_red', 'bright_blue', 'bright_magenta', 'bright_cyan', 'bright_green', 'bright_yellow']
+TUNER_COLORS = ['bright_red', 'bright_blue', 'bright_magenta', 'bright_cyan', 'bright_green', 'bright_yellow']
+REFRESH_PER_SECOND = 4
+# percentages for the raw APP packet values, signal level is 0-255 and quality 0-15
+LEVEL_TO_PERCENT = bytes((level * 100) // 255 for level in range(256))
+QUALITY_TO_PERCENT = bytes((quality * 100) // 15 for quality in range(16))
 
 log = create_logger('Display')
 
 
 @dataclass
 class TunerData:
-    channel: SatIpChannel
-    display_name: str
-    level_progress: Progress
     level_task: TaskID
-    quality_progress: Progress
     quality_task: TaskID
 
 
 class Display:
-    _lock: Lock
     _tuners: list[TunerData]
+    _latest: list[Optional[tuple[int, int]]]
+    """
+    Most recent (level, quality) per tuner, written by the RTP receiver threads and consumed by the refresh thread
+    """
+    _last_written: list[tuple[int, int]]
+    _dirty: Event
+    _refresh_thread: Thread
+    _refresh_thread_stop_event: Event
     _console: Console
-    _layout: Layout
+    _progress: Progress
+    """
+    A single progress renderable holding a signal and a quality task per tuner
+    """
     _live: Live
 
     def __init__(self):
-        self._lock = Lock()
         self._tuners: list[TunerData] = []
+        self._latest = []
+        self._last_written = []
+        self._dirty = Event()
+        self._refresh_thread_stop_event = Event()
         self._console = Console()
-
-    def register_tuner_return_update_callback(self, channel: SatIpChannel):
-        if self._is_started():
-            raise RuntimeError('Display already started')
-
-        display_name = f'{channel.frequency}/{channel.polarisation}'
-
-        if channel.display_name:
-            display_name += f'|{channel.display_name}'
-
-        level_progress = Progress(TextColumn("Signal"),
+        self._progress = Progress(TextColumn('[{task.fields[color]}]{task.fields[tuner]}'),
+                                  TextColumn('{task.description}'),
                                   BarColumn(),
                                   TaskProgressColumn(),
                                   disable=True,
                                   expand=False,
                                   )
-        level_task = level_progress.add_task("Signal", total=100)
-        quality_progress = Progress(TextColumn("Quality"),
-                                    BarColumn(),
-                                    TaskProgressColumn(),
-                                    disable=True,
-                                    expand=False,
-                                    )
-        quality_task = quality_progress.add_task("Quality", total=100)
-        self._tuners.append(TunerData(
-            channel=channel,
-            display_name=display_name,
-            level_progress=level_progress,
-            level_task=level_task,
-            quality_progress=quality_progress,
-            quality_task=quality_task))
-
-        def update_tuner_data(packet_data: bytes):
+
+    def register_tuner_return_update_callback(self, channel: SatIpChannel):
+        if self._is_started():
+            raise RuntimeError('Display already started')
+
+        tuner_idx = len(self._tuners)
+        color = TUNER_COLORS[tuner_idx % len(TUNER_COLORS)]
+        level_task = self._progress.add_task('Signal',
+                                             total=100,
+                                             tuner=f'Tuner {tuner_idx + 1} ({channel.display_label})',
+                                             color=color)
+        quality_task = self._progress.add_task('Quality', total=100, tuner='', color=color)
+        self._tuners.append(TunerData(level_task=level_task, quality_task=quality_task))
+        self._latest.append(None)
+        self._last_written.append((-1, -1))
+
+        def update_tuner_data(packet_data: memoryview):
             try:
                 # this can happen during initialization and shutdown
                 if not self._is_started():
                     return
 
-                app_packet = get_first_rtcp_app_packet_from_rtcp_data(packet_data)
-                level = int((app_packet.signal_level / 255) * 100)
-                quality = int((app_packet.quality / 15) * 100)
+                app_signal = get_first_rtcp_app_signal_from_rtcp_data(packet_data)
 
-                with self._lock:
-                    if not self._live.is_started:
-                        return
+                if not app_signal:
+                    return
 
-                    level_progress.update(level_task, completed=level)
-                    quality_progress.update(quality_task, completed=quality)
+                level = LEVEL_TO_PERCENT[app_signal.signal_level]
+                quality = QUALITY_TO_PERCENT[app_signal.quality]
+
+                # the refresh thread picks this up, so we don't contend on Rich's locks for every packet
+                self._latest[tuner_idx] = (level, quality)
+                self._dirty.set()
             except Exception as e:
-                log(f'Error displaying tuner update packet: {e}')
+                log('Error displaying tuner update packet: %s', e)
 
         return update_tuner_data
 
@@ -94,20 +98,39 @@ class Display:
         if self._is_started():
             raise RuntimeError('Display already started')
 
-        rows = []
-        self._layout = Layout(size=len(self._tuners) * 2)
-        for i, tuner_data in enumerate(self._tuners):
-            border_color = BORDER_COLORS[i % len(BORDER_COLORS)]
-            row_layout = Layout(name=f'Tuner {i + 1}', size=2)
-            row_layout.split_row(tuner_data.level_progress, tuner_data.quality_progress)
-            panel = Panel(row_layout, title=f'Tuner {i + 1} ({tuner_data.display_name})', border_style=border_color)
-            rows.append(panel)
-        self._layout.split_column(*rows)
-        self._live = Live(self._layout, console=self._console, refresh_per_second=4)
+        # the refresh thread repaints only when a value changed, see _refresh_handler
+        self._live = Live(self._progress, console=self._console, auto_refresh=False)
         self._live.start(True)
+        self._refresh_thread = Thread(target=self._refresh_handler, daemon=True)
+        self._refresh_thread.start()
+
+    def _refresh_handler(self):
+        while not self._refresh_thread_stop_event.is_set():
+            self._dirty.wait()
+            self._dirty.clear()
+            changed = False
+
+            for i, latest in enumerate(self._latest):
+                # signal values barely move once locked, so skip re-rendering unchanged bars
+                if not latest or latest == self._last_written[i]:
+                    continue
+
+                tuner_data = self._tuners[i]
+                self._progress.update(tuner_data.level_task, completed=latest[0])
+                self._progress.update(tuner_data.quality_task, completed=latest[1])
+                self._last_written[i] = latest
+                changed = True
+
+            if changed:
+                self._live.refresh()
+
+            self._refresh_thread_stop_event.wait(1 / REFRESH_PER_SECOND)
 
     def close(self):
         if self._is_started():
+            self._refresh_thread_stop_event.set()
+            self._dirty.set()
+            self._refresh_thread.join()
             self._live.stop()
             self._console.clear()
 
@@ -1,15 +1,16 @@
 #!/usr/bin/env python3
 import argparse
 import contextlib
+import logging
 import signal
 from typing import Optional
 
 from display import Display
 from rtcp import get_first_rtcp_app_packet_from_rtcp_data
-from rtp import RtpConnection
+from rtp import RtpConnection, RtpReactor
 from rtsp import RtspClient, RtspStream
 from satip import SatIpChannel, fetch_satip_device_xml_descriptor
-from util import create_logger
+from util import StderrHandler, create_logger
 
 RTSP_PORT = 554
 
@@ -47,7 +48,7 @@ def parse_args() -> (str, list[SatIpChannel]):
     for i, tune in enumerate(args.tune):
         parts = tune.split(',')
         if len(parts) < 5 or len(parts) > 6:
-            log(f'Invalid tune format: {tune}')
+            log('Invalid tune format: %s', tune)
             exit(1)
 
         modulation_system = parts[2]
@@ -62,11 +63,11 @@ def parse_args() -> (str, list[SatIpChannel]):
                 polarisation=(parts[1]),
                 fec=(int(parts[4])),
                 rolloff=0.35,
-                pids=[0],
+                pids=(0,),
                 display_name=(parts[5].strip() if len(parts) == 6 else None)
             ))
         except ValueError:
-            log(f'Invalid tune format: {tune}')
+            log('Invalid tune format: %s', tune)
             exit(1)
 
     return args.server_descriptor_url, channels
@@ -76,7 +77,8 @@ def close_everything(
         display: Optional[Display],
         rtsp_clients: list[Optional[RtspClient]],
         rtsp_streams: list[Optional[RtspStream]],
-        rtp_connections: list[Optional[RtpConnection]]):
+        rtp_connections: list[Optional[RtpConnection]],
+        rtp_reactor: Optional[RtpReactor]):
     if display:
         with contextlib.suppress(Exception):
             display.close()
@@ -91,6 +93,10 @@ def close_everything(
             with contextlib.suppress(Exception):
                 r.close()
 
+    if rtp_reactor:
+        with contextlib.suppress(Exception):
+            rtp_reactor.close()
+
     for c in rtsp_clients:
         if c:
             with contextlib.suppress(Exception):
@@ -98,18 +104,20 @@ def close_everything(
 
 
 def main():
+    logging.basicConfig(format='(%(name)s) %(message)s', handlers=[StderrHandler()], level=logging.INFO)
     arg_descriptor_url, arg_channels = parse_args()
     device_info = fetch_satip_device_xml_descriptor(arg_descriptor_url)
 
     if device_info.number_of_tuners < len(arg_channels):
-        log(f'Not enough tuners available on the SAT>IP server. '
-            f'({device_info.number_of_tuners} vs {len(arg_channels)})')
+        log('Not enough tuners available on the SAT>IP server. (%d vs %d)',
+            device_info.number_of_tuners, len(arg_channels))
         exit(1)
 
-    log(f'Connecting to {device_info.hostname} '
-        f'({device_info.manufacturer} {device_info.model_name}, {device_info.number_of_tuners} tuners)')
+    log('Connecting to %s (%s %s, %d tuners)',
+        device_info.hostname, device_info.manufacturer, device_info.model_name, device_info.number_of_tuners)
 
     display = Display()
+    rtp_reactor = RtpReactor()
     rtsp_clients = []
     rtsp_streams = []
     rtp_connections = []
@@ -117,8 +125,8 @@ def main():
     def signal_handler(signal, frame):
         # Display has to be closed first, so we can log to stderr again
         display.close()
-        log(f'Got signal {signal} => exiting')
-        close_everything(None, rtsp_clients, rtsp_streams, rtp_connections)
+        log('Got signal %s => exiting', signal)
+        close_everything(None, rtsp_clients, rtsp_streams, rtp_connections, rtp_reactor)
 
     signal.signal(signal.SIGINT, signal_handler)
     signal.signal(signal.SIGTERM, signal_handler)
@@ -131,16 +139,16 @@ def main():
             rtsp_stream = rtsp_client.setup_stream(channel, client_rtp_port, client_rtp_port + 1)
             rtsp_streams.append(rtsp_stream)
         except Exception as e:
-            log(f'Failed to setup stream {tuner_idx}: {e}')
-            close_everything(display, rtsp_clients, rtsp_streams, rtp_connections)
+            log('Failed to setup stream %d: %s', tuner_idx, e)
+            close_everything(display, rtsp_clients, rtsp_streams, rtp_connections, rtp_reactor)
             exit(1)
 
         try:
-            rtp_connection = rtsp_stream.play([1])
+            rtp_connection = rtsp_stream.play([1], rtp_reactor)
             rtp_connections.append(rtp_connection)
         except Exception as e:
-            log(f'Failed to play stream: {e}')
-            close_everything(display, rtsp_clients, rtsp_streams, rtp_connections)
+            log('Failed to play stream: %s', e)
+            close_everything(display, rtsp_clients, rtsp_streams, rtp_connections, rtp_reactor)
             exit(1)
 
         update_callback = display.register_tuner_return_update_callback(channel)
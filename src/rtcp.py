@@ -1,5 +1,15 @@
+import re
+import struct
+from dataclasses import dataclass
 from typing import Optional
 
+# byte 0 (version, padding, reception report count), packet type, length in 32-bit words minus one; followed by SSRC
+_RTCP_HEADER = struct.Struct('>BBH')
+_RTCP_HEADER_SIZE = 8
+_APP_HEADER = struct.Struct('>4sHH')
+_APP_DATA_RE = re.compile(rb'ver=(?P<ver>[^;]*);src=(?P<src>\d+);tuner=(?P<tuner>[^;]*)(?:;pids=(?P<pids>[\d,]*))?')
+_APP_TUNER_RE = re.compile(rb';tuner=[^,;]*,(?P<level>\d+),[^,;]*,(?P<quality>\d+),')
+
 
 class RtcpPacketAppSatIp:
     """
@@ -42,10 +52,9 @@ class RtcpPacketAppSatIp:
     pids: list[int]
 
     def __init__(self, specific_data: bytes):
-        self.name = specific_data[:4].decode('ascii')
-        identifier = int.from_bytes(specific_data[4:6], byteorder='big')
-        string_length = int.from_bytes(specific_data[6:8], byteorder='big')
-        application_data = specific_data[8:].decode('utf-8').rstrip('\0')
+        name, identifier, string_length = _APP_HEADER.unpack_from(specific_data)
+        self.name = name.decode('ascii')
+        application_data = specific_data[8:].rstrip(b'\0')
 
         if identifier != 0:
             raise ValueError(f'Invalid SatIp APP packet, expected identifier=0000, got identifier={identifier}')
@@ -53,79 +62,107 @@ class RtcpPacketAppSatIp:
         if len(application_data) != string_length:
             raise ValueError(f'Invalid SatIp APP packet, expected len={string_length}, got len={len(application_data)}')
 
-        for entry in application_data.split(';'):
-            if entry.startswith('ver='):
-                self.version = entry.replace('ver=', '')
-                continue
-            if entry.startswith('src='):
-                self.source = int(entry.replace('src=', ''))
-                continue
-            if entry.startswith('tuner='):
-                tuner_data = entry.replace('tuner=', '').strip().split(',')
-
-                if len(tuner_data) != 12:
-                    raise ValueError(f'Invalid SatIp APP packet, got tuner len={len(tuner_data)} != 12')
-
-                self.frontend_id = int(tuner_data[0])
-                self.signal_level = int(tuner_data[1])
-                self.lock = True if tuner_data[2] == 1 else False
-                self.quality = int(tuner_data[3])
-                self.frequency = float(tuner_data[4])
-                self.polarisation = tuner_data[5]
-                self.system = tuner_data[6]  # dvbs, dvbs2
-                self.type = tuner_data[7]  # qpsk, 8psk
-                self.pilots = True if tuner_data[8].lower() == 'on' else False
-                self.roll_off = float(tuner_data[9])
-                self.symbol_rate = int(tuner_data[10])
-                self.fec_inner = int(tuner_data[11])
-
-                if self.signal_level < 0 or self.signal_level > 255:
-                    raise ValueError(f'Invalid SatIp APP packet, expected signal_level=0-255, got={self.signal_level}')
-
-                if self.quality < 0 or self.quality > 15:
-                    raise ValueError(f'Invalid SatIp APP packet, expected quality=0-15, got={self.quality}')
-
-                continue
-            if entry.startswith('pids='):
-                self.pids = [int(x) for x in entry.replace('pids=', '').split(',')]
-                continue
-
-
-def get_first_rtcp_app_packet_from_rtcp_data(packet: bytes) -> Optional[RtcpPacketAppSatIp]:
+        match = _APP_DATA_RE.match(application_data)
+
+        if not match:
+            raise ValueError(f'Invalid SatIp APP packet, unexpected format: {application_data}')
+
+        self.version = match['ver'].decode('ascii')
+        self.source = int(match['src'])
+        tuner_data = match['tuner'].strip().split(b',')
+
+        if len(tuner_data) != 12:
+            raise ValueError(f'Invalid SatIp APP packet, got tuner len={len(tuner_data)} != 12')
+
+        self.frontend_id = int(tuner_data[0])
+        self.signal_level = int(tuner_data[1])
+        self.lock = True if tuner_data[2] == 1 else False
+        self.quality = int(tuner_data[3])
+        self.frequency = float(tuner_data[4])
+        self.polarisation = tuner_data[5].decode('ascii')
+        self.system = tuner_data[6].decode('ascii')  # dvbs, dvbs2
+        self.type = tuner_data[7].decode('ascii')  # qpsk, 8psk
+        self.pilots = True if tuner_data[8].lower() == b'on' else False
+        self.roll_off = float(tuner_data[9])
+        self.symbol_rate = int(tuner_data[10])
+        self.fec_inner = int(tuner_data[11])
+
+        if self.signal_level < 0 or self.signal_level > 255:
+            raise ValueError(f'Invalid SatIp APP packet, expected signal_level=0-255, got={self.signal_level}')
+
+        if self.quality < 0 or self.quality > 15:
+            raise ValueError(f'Invalid SatIp APP packet, expected quality=0-15, got={self.quality}')
+
+        if match['pids'] is not None:
+            self.pids = [int(x) for x in match['pids'].split(b',')]
+
+
+@dataclass(slots=True)
+class RtcpAppSignal:
+    """
+    The subset of the SAT>IP APP packet needed to display a tuner, see RtcpPacketAppSatIp for the value ranges.
+    """
+    signal_level: int
+    quality: int
+
+
+def get_first_rtcp_app_packet_from_rtcp_data(packet: bytes | memoryview) -> Optional[RtcpPacketAppSatIp]:
     """
     Takes received RTCP data and returns the first APP packet found, discarding all other packet types encountered.
     """
+    specific_data = _find_first_rtcp_app_specific_data(packet)
+    return RtcpPacketAppSatIp(specific_data) if specific_data is not None else None
+
+
+def get_first_rtcp_app_signal_from_rtcp_data(packet: bytes | memoryview) -> Optional[RtcpAppSignal]:
+    """
+    Like get_first_rtcp_app_packet_from_rtcp_data, but only extracts signal level and quality from the APP packet.
+    """
+    specific_data = _find_first_rtcp_app_specific_data(packet)
+
+    if specific_data is None:
+        return None
+
+    match = _APP_TUNER_RE.search(specific_data, 8)
+
+    if not match:
+        raise ValueError('Invalid SatIp APP packet, missing tuner data')
+
+    signal_level = int(match['level'])
+    quality = int(match['quality'])
+
+    if signal_level > 255:
+        raise ValueError(f'Invalid SatIp APP packet, expected signal_level=0-255, got={signal_level}')
+
+    if quality > 15:
+        raise ValueError(f'Invalid SatIp APP packet, expected quality=0-15, got={quality}')
+
+    return RtcpAppSignal(signal_level, quality)
+
+
+def _find_first_rtcp_app_specific_data(packet: bytes | memoryview) -> Optional[bytes]:
     index = 0
     packet_length = len(packet)
 
     while index + 4 < packet_length:
         packet_start = index
-        byte_0 = packet[index]
-        version = (byte_0 & 0b11000000) >> 6
-        # ignoring unused: padding = (byte_0 & 0b00100000) >> 5
-        reception_report_count = (byte_0 & 0b00011111)
-        index += 1
-        packet_type = packet[index]
-        index += 1
-        length = int.from_bytes(packet[index:index + 2], byteorder='big') * 4 + 4
-        index += 2
-        # ignoring unused: ssrc = int.from_bytes(packet[index:index+4], byteorder='big')
-        index += 4
-
-        if version != 2:
-            raise ValueError(f'Invalid RTCP packet, expected version=2, got {version}')
-
-        if reception_report_count < 0:
-            raise ValueError(f'Invalid RTCP packet, expected reception_report_count >= 0, got {reception_report_count}')
+        byte_0, packet_type, length = _RTCP_HEADER.unpack_from(packet, index)
+        # ignoring unused: padding, reception report count, ssrc
+        length = length * 4 + 4
+
+        # the top two bits hold the version, which has to be 2
+        if byte_0 & 0b11000000 != 0b10000000:
+            raise ValueError(f'Invalid RTCP packet, expected version=2, got {byte_0 >> 6}')
 
         if packet_start + length > packet_length:
             raise ValueError(f'Invalid RTCP packet, expected length={length}, got {packet_length}')
 
-        specific_data = packet[index:index + length - 4]
+        # length is at least 4, so this always moves on to the next packet
         index = packet_start + length
 
         # we're only interested in the APP packets, as they contain the signal & quality data
         if packet_type != 204:
             continue
 
-        return RtcpPacketAppSatIp(specific_data)
+        # copy, as the packet may be a memoryview into a reused receive buffer
+        return bytes(packet[packet_start + _RTCP_HEADER_SIZE:index])
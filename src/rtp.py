@@ -1,73 +1,174 @@
-import os
-import select
+import selectors
 import socket
+import sys
 from threading import Event, Thread
 from typing import Optional
 
 from util import (create_logger)
 
+STOP_POLL_INTERVAL_S = 0.25
+# absorbs bursts while the receiver thread waits for the GIL, the kernel caps this at net.core.rmem_max
+SOCKET_RECEIVE_BUFFER_SIZE = 8 * 1024 * 1024
+# Linux only, and not exposed by the socket module
+SO_RCVBUFFORCE = 33 if sys.platform.startswith('linux') else None
+MAX_PACKETS_PER_WAKEUP = 32
+
 log = create_logger('RTP')
 
 
-class RtpConnection(object):
-    _rtp_socket: socket.socket
-    _rtcp_socket: socket.socket
+class RtpReactor(object):
+    """
+    Runs a single receiver thread for all RtpConnections. Sockets are registered with a handler, which is called from
+    the receiver thread once the socket becomes readable.
+    """
+    _selector: selectors.BaseSelector
     _receiver_thread: Thread
     _receiver_thread_stop_event: Event
-    _receiver_thread_stop_pipe: tuple[int, int]
-    _rtp_callback: Optional[callable]
-    _rtcp_callback: Optional[callable]
 
-    def __init__(self, client_rtp_port: int, client_rtcp_port: int) -> None:
+    def __init__(self) -> None:
         self._receiver_thread_stop_event = Event()
-        self._receiver_thread_stop_pipe = os.pipe()
-        self._rtp_callback = None
-        self._rtcp_callback = None
-        self._rtp_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-        self._rtp_socket.bind(('0.0.0.0', client_rtp_port))
-        self._rtcp_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-        self._rtcp_socket.bind(('0.0.0.0', client_rtcp_port))
+        # the registered data is the handler to call once the socket becomes readable
+        self._selector = selectors.DefaultSelector()
         self._receiver_thread = Thread(target=self._packet_receiver_handler)
         self._receiver_thread.start()
-        log(f'Connection running, listening on {client_rtp_port}/rtp and {client_rtcp_port}/rtcp')
+
+    def register(self, sock: socket.socket, handler: callable):
+        self._selector.register(sock, selectors.EVENT_READ, handler)
+
+    def unregister(self, sock: socket.socket):
+        self._selector.unregister(sock)
 
     def _packet_receiver_handler(self):
-        socket_list = [self._rtp_socket, self._rtcp_socket, self._receiver_thread_stop_pipe[0]]
         while not self._receiver_thread_stop_event.is_set():
             try:
-                read_sockets, _, _ = select.select(socket_list, [], [])
-                for sock in read_sockets:
-                    if sock == self._rtp_socket:
-                        packet = sock.recv(4096)
-                        if packet and self._rtp_callback:
-                            try:
-                                self._rtp_callback(packet)
-                            except Exception as e:
-                                log('Error in rtp callback: {e}')
-                    elif sock == self._rtcp_socket:
-                        packet = sock.recv(4096)
-                        if packet and self._rtcp_callback:
-                            try:
-                                self._rtcp_callback(packet)
-                            except Exception as e:
-                                log('Error in rtcp callback: {e}')
+                # wake up regularly to notice the stop event, instead of keeping a pipe around just for that
+                ready = self._selector.select(STOP_POLL_INTERVAL_S)
             except Exception as e:
-                log(f'Error receiving packet: {e}')
+                log('Error waiting for packets: %s', e)
                 break
 
-        log(f'Connection packet receiver thread exited')
+            for key, _ in ready:
+                # a single bad packet or socket must not stop receiving for all other connections
+                try:
+                    key.data()
+                except Exception as e:
+                    log('Error receiving packet: %s', e)
+
+        log('Packet receiver thread exited')
 
     def close(self):
-        log(f'Closing connection on {self._rtp_socket.getsockname()[1]}/rtp, {self._rtcp_socket.getsockname()[1]}/rtcp')
+        log('Closing RtpReactor')
         self._receiver_thread_stop_event.set()
-        os.write(self._receiver_thread_stop_pipe[1], b'0')
+        self._receiver_thread.join()
+        self._selector.close()
+        log('RtpReactor closed')
+
+
+class RtpConnection(object):
+    __slots__ = ('_reactor', '_rtp_socket', '_rtcp_socket', '_rtp_callback', '_rtcp_callback', '_rtp_buffer',
+                 '_rtcp_buffer')
+    _reactor: RtpReactor
+    _rtp_socket: socket.socket
+    _rtcp_socket: socket.socket
+    _rtp_callback: Optional[callable]
+    _rtcp_callback: Optional[callable]
+    _rtp_buffer: memoryview
+    _rtcp_buffer: memoryview
+
+    def __init__(self, reactor: RtpReactor, client_rtp_port: int, client_rtcp_port: int) -> None:
+        self._reactor = reactor
+        self._rtp_callback = None
+        self._rtcp_callback = None
+        # callbacks get slices of these, see register_rtp_packet_received_callback
+        self._rtp_buffer = memoryview(bytearray(4096))
+        self._rtcp_buffer = memoryview(bytearray(4096))
+        self._rtp_socket = self._open_socket(client_rtp_port)
+        self._rtcp_socket = self._open_socket(client_rtcp_port)
+        self._enlarge_receive_buffer(self._rtcp_socket)
+        # the RTP socket is only watched and given a large buffer once someone consumes the stream, see
+        # register_rtp_packet_received_callback
+        self._reactor.register(self._rtcp_socket, self._receive_rtcp_packets)
+        log('Connection running, listening on %d/rtp and %d/rtcp', client_rtp_port, client_rtcp_port)
+
+    @staticmethod
+    def _open_socket(port: int) -> socket.socket:
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        sock.bind(('0.0.0.0', port))
+        # each wakeup reads up to MAX_PACKETS_PER_WAKEUP queued packets, see _drain_socket
+        sock.setblocking(False)
+        return sock
+
+    @staticmethod
+    def _enlarge_receive_buffer(sock: socket.socket):
+        """
+        Only done for sockets which are actually read, as the buffer pins kernel memory once packets queue up in it.
+        """
+        forced = False
+
+        if SO_RCVBUFFORCE:
+            # not capped by net.core.rmem_max, but requires CAP_NET_ADMIN
+            try:
+                sock.setsockopt(socket.SOL_SOCKET, SO_RCVBUFFORCE, SOCKET_RECEIVE_BUFFER_SIZE)
+                forced = True
+            except OSError:
+                pass
+
+        if not forced:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, SOCKET_RECEIVE_BUFFER_SIZE)
+
+        # makes a too low net.core.rmem_max visible, note that Linux reports twice the size it was set to
+        receive_buffer_size = sock.getsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF)
+        log('Receive buffer on port %d is %d bytes', sock.getsockname()[1], receive_buffer_size)
+
+    def _receive_rtp_packets(self):
+        self._drain_socket(self._rtp_socket, self._rtp_buffer, self._rtp_callback, 'rtp')
+
+    def _receive_rtcp_packets(self):
+        self._drain_socket(self._rtcp_socket, self._rtcp_buffer, self._rtcp_callback, 'rtcp')
+
+    @staticmethod
+    def _drain_socket(sock: socket.socket, buffer: memoryview, callback: Optional[callable], name: str):
+        """
+        Receives the packets queued on the non-blocking socket, so a burst costs one wakeup instead of one per packet.
+        At most MAX_PACKETS_PER_WAKEUP are read, so one busy socket can't starve the others sharing the reactor. The
+        selector is level-triggered and reports the socket again right away if packets are left.
+        """
+        for _ in range(MAX_PACKETS_PER_WAKEUP):
+            try:
+                packet_length = sock.recv_into(buffer)
+            except BlockingIOError:
+                return
+
+            if packet_length and callback:
+                try:
+                    callback(buffer[:packet_length])
+                except Exception as e:
+                    log('Error in %s callback: %s', name, e)
+
+    def close(self):
+        log('Closing connection on %d/rtp, %d/rtcp',
+            self._rtp_socket.getsockname()[1], self._rtcp_socket.getsockname()[1])
+        if self._rtp_callback:
+            self._reactor.unregister(self._rtp_socket)
+        self._reactor.unregister(self._rtcp_socket)
         self._rtp_socket.close()
         self._rtcp_socket.close()
-        self._receiver_thread.join()
         log('RtpConnection closed')
 
     def register_rtp_packet_received_callback(self, callback: callable):
+        """
+        The callback receives a memoryview into a reused receive buffer, which is only valid until the callback returns.
+        Copy it via bytes() if the packet needs to be kept.
+        Until a callback is registered, RTP packets aren't read at all and are simply dropped by the kernel.
+        """
+        if not self._rtp_callback:
+            self._enlarge_receive_buffer(self._rtp_socket)
+            self._reactor.register(self._rtp_socket, self._receive_rtp_packets)
         self._rtp_callback = callback
 
     def register_rtcp_packet_received_callback(self, callback: callable):
+        """
+        The callback receives a memoryview into a reused receive buffer, which is only valid until the callback returns.
+        Copy it via bytes() if the packet needs to be kept.
+        """
         self._rtcp_callback = callback
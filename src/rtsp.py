@@ -1,11 +1,12 @@
-from email.message import Message
-from email.parser import BytesParser
-from threading import Condition, Event, Lock, Thread
+import contextlib
+import sched
+import time
+from threading import Event, Lock, Thread
 from typing import Optional
 
 import pycurl
 
-from rtp import RtpConnection
+from rtp import RtpConnection, RtpReactor
 from satip import SatIpChannel
 from util import create_logger
 
@@ -17,32 +18,45 @@ log = create_logger('RTSP')
 
 
 class RtspResponse:
-    _header_buffer: bytes
-    _package_buffer: bytes
+    __slots__ = ('_header_chunks', '_package_chunks', 'status_code', 'headers', 'data')
+    _header_chunks: list[bytes]
+    _package_chunks: list[bytes]
     status_code: int
-    headers: Message
+    headers: dict[str, str]
+    """
+    Header names are lower-cased, as they are case-insensitive
+    """
     data: str
 
     def __init__(self):
-        self._header_buffer = ''.encode('ascii')
-        self._package_buffer = ''.encode('ascii')
+        # curl hands over the response in many small chunks, they are only joined once in finalize
+        self._header_chunks = []
+        self._package_chunks = []
 
     def append_header(self, data: bytes) -> None:
-        self._header_buffer += data
+        self._header_chunks.append(data)
 
     def append_data(self, data: bytes) -> None:
-        self._package_buffer += data
+        self._package_chunks.append(data)
 
     def finalize(self):
-        raw_headers = self._header_buffer.decode('ascii')
-        data = self._package_buffer.decode('ascii')
+        raw_headers = b''.join(self._header_chunks).decode('ascii')
+        data = b''.join(self._package_chunks).decode('ascii')
         header_lines = raw_headers.split('\r\n')
 
         if len(header_lines) < 2:
             raise ValueError(f'Invalid RTSP response: Less than two lines: {header_lines}')
 
         self.status_code = RtspResponse.parse_status_line_return_code(header_lines.pop(0))
-        self.headers = BytesParser().parsebytes(('\r\n'.join(header_lines)).encode('ascii'))
+        self.headers = {}
+
+        for line in header_lines:
+            if not line:
+                continue
+
+            name, _, value = line.partition(':')
+            self.headers[name.strip().lower()] = value.strip()
+
         self.data = data
 
     @classmethod
@@ -50,27 +64,43 @@ class RtspResponse:
         if not status_line.startswith('RTSP/1.0 '):
             raise ValueError('Invalid RTSP response')
 
-        status_line = status_line[len('RTSP/1.0 '):]
-        status_split_by_space = status_line.split(' ')
+        # the status code is always three digits, directly following the preamble
+        status_code = status_line[9:12]
 
-        if not status_split_by_space[0].isdigit():
-            raise ValueError(f'Invalid RTSP response, expecting status code, got {status_split_by_space[0]}')
+        if len(status_code) != 3 or not status_code.isdigit() or status_line[12:13] not in ('', ' '):
+            raise ValueError(f'Invalid RTSP response, expecting status code, got {status_line[9:]}')
 
-        return int(status_split_by_space[0])
+        return int(status_code)
 
     def __str__(self):
-        header_str = self.headers.__str__().replace('\n', ' ').strip()
+        header_str = ' '.join(f'{name}: {value}' for name, value in self.headers.items())
         return f'RtspResponse(status_code={self.status_code}, headers={header_str}, data={self.data})'
 
 
 class RtspConnection(object):
+    __slots__ = ('_curl', '_lock', '_response', 'base_uri')
     _curl: pycurl.Curl
     _lock: Lock
+    _response: Optional[RtspResponse]
+    """
+    The response of the request currently performed, filled by the curl callbacks
+    """
     base_uri: str
 
     def __init__(self, server_host: str, server_port: int) -> None:
         self._curl = pycurl.Curl()
+        # options that are the same for every request, curl keeps them across perform() calls
+        self._curl.setopt(pycurl.TIMEOUT, 4)
+        self._curl.setopt(pycurl.USERAGENT, 'pycurl')
+        # keep the RTSP control connection alive between the sparse OPTIONS keepalive requests
+        self._curl.setopt(pycurl.TCP_KEEPALIVE, 1)
+        self._curl.setopt(pycurl.TCP_KEEPIDLE, 30)
+        self._curl.setopt(pycurl.TCP_KEEPINTVL, 10)
+        self._curl.setopt(pycurl.TCP_NODELAY, 1)
+        self._curl.setopt(pycurl.WRITEFUNCTION, self._append_data)
+        self._curl.setopt(pycurl.HEADERFUNCTION, self._append_header)
         self._lock = Lock()
+        self._response = None
         port_or_empty = f':{server_port}' if server_port != 554 else ''
         self.base_uri = f'rtsp://{server_host}{port_or_empty}/'
 
@@ -79,19 +109,26 @@ class RtspConnection(object):
             rtsp_response = RtspResponse()
             self._curl.setopt(pycurl.URL, f'{self.base_uri}{url_part}')
             self._curl.setopt(pycurl.OPT_RTSP_REQUEST, method)
-            self._curl.setopt(pycurl.WRITEFUNCTION, rtsp_response.append_data)
-            self._curl.setopt(pycurl.HEADERFUNCTION, rtsp_response.append_header)
-            self._curl.setopt(pycurl.TIMEOUT, 4)
-            self._curl.setopt(pycurl.USERAGENT, 'pycurl')
 
             if extra_curl_opts is not None:
                 for key, value in extra_curl_opts.items():
                     self._curl.setopt(key, value)
 
-            self._curl.perform()
+            self._response = rtsp_response
+            try:
+                self._curl.perform()
+            finally:
+                self._response = None
+
             rtsp_response.finalize()
             return rtsp_response
 
+    def _append_header(self, data: bytes) -> None:
+        self._response.append_header(data)
+
+    def _append_data(self, data: bytes) -> None:
+        self._response.append_data(data)
+
     def close(self):
         log('Closing RtspConnection')
         with self._lock:
@@ -99,6 +136,7 @@ class RtspConnection(object):
 
 
 class RtspStream(object):
+    __slots__ = ('_connection', '_session_id', '_client_rtp_port', '_client_rtcp_port', '_stream_id')
     _connection: RtspConnection
     _session_id: str
     _client_rtp_port: int
@@ -113,76 +151,120 @@ class RtspStream(object):
         self._client_rtp_port = client_rtp_port
         self._client_rtcp_port = client_rtcp_port
 
-    def play(self, pids: list[int]) -> Optional[RtpConnection]:
-        log(f'Playing stream={self._stream_id} with pids={pids}')
+    def play(self, pids: list[int], rtp_reactor: RtpReactor) -> Optional[RtpConnection]:
+        log('Playing stream=%s with pids=%s', self._stream_id, pids)
         pids_str = ','.join(map(str, pids))
         url = f'stream={self._stream_id}?addpids={pids_str}'
         curl_extra_opts = {pycurl.OPT_RTSP_STREAM_URI: f'{self._connection.base_uri}{url}'}
         rtsp_response = self._connection.perform_rtsp_request(url, pycurl.RTSPREQ_PLAY, curl_extra_opts)
-        rtp_connection = RtpConnection(self._client_rtp_port, self._client_rtcp_port)
+        rtp_connection = RtpConnection(rtp_reactor, self._client_rtp_port, self._client_rtcp_port)
 
         if rtsp_response.status_code != 200:
-            log(f'Failed to play stream={self._stream_id}, got response={rtsp_response}')
+            log('Failed to play stream=%s, got response=%s', self._stream_id, rtsp_response)
             rtp_connection.close()
             raise RuntimeError(f'Failed to play stream={self._stream_id}, got response={rtsp_response}')
 
         return rtp_connection
 
     def teardown(self) -> bool:
-        log(f'Teardown stream={self._stream_id}')
+        log('Teardown stream=%s', self._stream_id)
         url = f'stream={self._stream_id}'
         rtsp_response = self._connection.perform_rtsp_request(url, pycurl.RTSPREQ_TEARDOWN)
 
         if rtsp_response.status_code != 200:
-            log(f'Failed to teardown stream={self._stream_id}, got response={rtsp_response}')
+            log('Failed to teardown stream=%s, got response=%s', self._stream_id, rtsp_response)
             return False
 
-        log(f'Successfully tore down stream={self._stream_id}')
+        log('Successfully tore down stream=%s', self._stream_id)
         return True
 
 
+class KeepaliveScheduler(object):
+    """
+    Runs the periodic OPTIONS requests of all RtspClients from a single daemon thread.
+    """
+    _scheduler: sched.scheduler
+    _wakeup_event: Event
+    _thread: Optional[Thread]
+    _lock: Lock
+
+    def __init__(self) -> None:
+        self._wakeup_event = Event()
+        self._scheduler = sched.scheduler(time.monotonic, self._wait)
+        self._thread = None
+        self._lock = Lock()
+
+    def enter(self, delay_s: float, action: callable) -> sched.Event:
+        event = self._scheduler.enter(delay_s, 1, action)
+
+        with self._lock:
+            if not self._thread:
+                self._thread = Thread(target=self._run, daemon=True)
+                self._thread.start()
+
+        # the thread may be waiting for a later event or for an empty queue
+        self._wakeup_event.set()
+        return event
+
+    def cancel(self, event: sched.Event):
+        # the event may already be running or done
+        with contextlib.suppress(ValueError):
+            self._scheduler.cancel(event)
+
+    def _wait(self, timeout_s: Optional[float]):
+        self._wakeup_event.wait(timeout_s)
+        self._wakeup_event.clear()
+
+    def _run(self):
+        while True:
+            self._scheduler.run()
+            self._wait(None)
+
+
+keepalive_scheduler = KeepaliveScheduler()
+
+
 class RtspClient(object):
-    _options_thread: Optional[Thread]
-    _options_thread_stop_event: Event
-    _options_thread_sleep_cond: Condition
+    _options_event: Optional[sched.Event]
+    _options_stop_event: Event
     _connection: RtspConnection
 
     def __init__(self, server_ip: str, server_port: int, ) -> None:
-        self._options_thread_stop_event = Event()
-        self._options_thread_sleep_cond = Condition()
+        self._options_event = None
+        self._options_stop_event = Event()
         self._connection = RtspConnection(server_ip, server_port)
 
     def close(self):
         log('Closing RtspClient')
-        self._options_thread_stop_event.set()
-        with self._options_thread_sleep_cond:
-            self._options_thread_sleep_cond.notify()
-        if self._options_thread and self._options_thread.is_alive():
-            self._options_thread.join()
-            log('Options thread joined')
+        self._options_stop_event.set()
+        if self._options_event:
+            keepalive_scheduler.cancel(self._options_event)
+        # waits for a running OPTIONS request, as the connection lock is held during requests
         self._connection.close()
 
-    def _start_options_thread(self, timeout_s):
+    def _start_options_keepalive(self, timeout_s):
+        # Subtract a little time to account for setup process etc
+        timeout_s -= 2
+
         def send_options_request():
-            rtsp_response = self._connection.perform_rtsp_request('', pycurl.RTSPREQ_OPTIONS)
+            if self._options_stop_event.is_set():
+                return
 
-            if rtsp_response.status_code != 200:
-                log(f'Options request failed, got response={rtsp_response}')
+            try:
+                rtsp_response = self._connection.perform_rtsp_request('', pycurl.RTSPREQ_OPTIONS)
 
-        # Subtract a little time to account for setup process etc
-        timeout_s -= 2
+                if rtsp_response.status_code != 200:
+                    log('Options request failed, got response=%s', rtsp_response)
+            except Exception as e:
+                log('Options request failed: %s', e)
 
-        def thread_wrapper():
-            while not self._options_thread_stop_event.is_set():
-                send_options_request()
-                with self._options_thread_sleep_cond:
-                    self._options_thread_sleep_cond.wait(timeout_s)
+            if not self._options_stop_event.is_set():
+                self._options_event = keepalive_scheduler.enter(timeout_s, send_options_request)
 
-        self._options_thread = Thread(target=thread_wrapper)
-        self._options_thread.start()
+        self._options_event = keepalive_scheduler.enter(0, send_options_request)
 
     def setup_stream(self, channel: SatIpChannel, client_rtp_port: int, client_rtcp_port: int) -> Optional[RtspStream]:
-        log(f'Setting up stream: tuner #{channel.frontend}, frequency={channel.frequency}/{channel.polarisation}')
+        log('Setting up stream: tuner #%s, frequency=%s/%s', channel.frontend, channel.frequency, channel.polarisation)
         url = channel.to_stream_uri_params()
         transport = f'RTP/AVP;unicast;client_port={client_rtp_port}-{client_rtcp_port}'
         extra_curl_opts = {
@@ -192,13 +274,13 @@ class RtspClient(object):
         rtsp_response = self._connection.perform_rtsp_request(url, pycurl.RTSPREQ_SETUP, extra_curl_opts)
 
         if rtsp_response.status_code != 200:
-            log(f'Failed to setup stream for url={url}, got response={rtsp_response}')
+            log('Failed to setup stream for url=%s, got response=%s', url, rtsp_response)
             raise ValueError(f'Failed to setup stream for url={url}, got response={rtsp_response}')
 
-        stream_id = int(rtsp_response.headers['com.ses.streamID'])
-        session_id, timeout = rtsp_response.headers['Session'].split(';')
+        stream_id = int(rtsp_response.headers['com.ses.streamid'])
+        session_id, timeout = rtsp_response.headers['session'].split(';')
         timeout = int(timeout.replace('timeout=', '')) or 60
         result = RtspStream(self._connection, session_id, stream_id, client_rtp_port, client_rtcp_port)
 
-        self._start_options_thread(timeout)
+        self._start_options_keepalive(timeout)
         return result
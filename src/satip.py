@@ -1,15 +1,43 @@
-import xml.etree.ElementTree as ET
-from dataclasses import dataclass
-from typing import Optional
-from urllib.parse import urlparse
+import atexit
+import functools
+from dataclasses import dataclass, field
+from typing import Iterable, Optional
+from urllib.parse import urlsplit
+from xml.parsers import expat
 
 import requests
+from requests.adapters import HTTPAdapter
 
 from util import create_logger
 
+UPNP_DEVICE_NAMESPACE = 'urn:schemas-upnp-org:device-1-0'
+SATIP_NAMESPACE = 'urn:ses-com:satip'
+# expat reports namespaced element names as '<namespace> <local name>'
+TAG_DEVICE = f'{UPNP_DEVICE_NAMESPACE} device'
+TAG_MANUFACTURER = f'{UPNP_DEVICE_NAMESPACE} manufacturer'
+TAG_MODEL_NAME = f'{UPNP_DEVICE_NAMESPACE} modelName'
+TAG_SERIAL_NUMBER = f'{UPNP_DEVICE_NAMESPACE} serialNumber'
+TAG_SATIPCAP = f'{SATIP_NAMESPACE} X_SATIPCAP'
+DEVICE_FIELD_TAGS = frozenset((TAG_MANUFACTURER, TAG_MODEL_NAME, TAG_SERIAL_NUMBER, TAG_SATIPCAP))
+DESCRIPTOR_CHUNK_SIZE = 4096
+# connect and read timeout, SAT>IP servers are on the local network and either answer quickly or not at all
+HTTP_TIMEOUT_S = (2, 5)
+VALID_CAPABILITY_TYPES = frozenset(('DVBS2', 'DVBT', 'DVBT2', 'DVBC', 'DVBC2'))
+VALID_POLARISATIONS = frozenset(('v', 'h'))
+VALID_MODULATION_SYSTEMS = frozenset(('dvbs', 'dvbs2'))
+VALID_MODULATION_TYPES = frozenset(('qpsk', '8psk'))
+VALID_FECS = frozenset((12, 23, 34, 56, 78, 89, 35, 45, 910))
+VALID_ROLLOFFS = frozenset((0.20, 0.25, 0.35))
+
 log = create_logger('SatIp')
 
-@dataclass
+# reused across fetches, so repeated requests to the same server don't each open a new connection
+_http_session = requests.Session()
+_http_session.mount('http://', HTTPAdapter(pool_connections=4, pool_maxsize=8))
+atexit.register(_http_session.close)
+
+
+@dataclass(frozen=True, slots=True)
 class SatIpDeviceInfo:
     hostname: str
     manufacturer: str
@@ -31,27 +59,32 @@ class SatIpDeviceInfo:
         )
 
 
+# the descriptor doesn't change while we're running, use cache_clear() to force a refetch
+@functools.lru_cache(maxsize=32)
 def fetch_satip_device_xml_descriptor(descriptor_url: str) -> SatIpDeviceInfo:
-    log(f'Fetching SAT>IP device descriptor from {descriptor_url}')
-    server_url = urlparse(descriptor_url)
-    response = requests.get(descriptor_url)
-    response.raise_for_status()
-    raw_xml = response.text
-
-    parsed_descriptor = ET.fromstring(raw_xml)
-    namespaces = {
-        'root': 'urn:schemas-upnp-org:device-1-0',
-        'ses': 'urn:ses-com:satip',
-    }
-    device_manufacturer = parsed_descriptor.find('root:device/root:manufacturer', namespaces).text.strip()
-    device_model = parsed_descriptor.find('root:device/root:modelName', namespaces).text.strip()
-    serial_number = parsed_descriptor.find('root:device/root:serialNumber', namespaces).text.strip()
-    satipcap = parsed_descriptor.find('root:device/ses:X_SATIPCAP', namespaces).text.strip().split('-')
+    log('Fetching SAT>IP device descriptor from %s', descriptor_url)
+    server_url = urlsplit(descriptor_url)
+
+    with _http_session.get(descriptor_url, stream=True, timeout=HTTP_TIMEOUT_S) as response:
+        if response.status_code >= 400:
+            response.raise_for_status()
+
+        descriptor_chunks = response.iter_content(DESCRIPTOR_CHUNK_SIZE)
+        device_fields = _parse_device_fields(descriptor_chunks)
+
+        # requests closes the connection instead of returning it to the pool if the body wasn't read completely
+        for _ in descriptor_chunks:
+            pass
+
+    device_manufacturer = _get_device_field(device_fields, TAG_MANUFACTURER)
+    device_model = _get_device_field(device_fields, TAG_MODEL_NAME)
+    serial_number = _get_device_field(device_fields, TAG_SERIAL_NUMBER)
+    satipcap = _get_device_field(device_fields, TAG_SATIPCAP).split('-')
 
     if len(satipcap) != 2 or not satipcap[1].isdigit():
         raise ValueError('Invalid SAT>IP capability, expecting two parts separated by a dash')
 
-    if satipcap[0] not in ['DVBS2',  'DVBT', 'DVBT2', 'DVBC', 'DVBC2']:
+    if satipcap[0] not in VALID_CAPABILITY_TYPES:
         raise ValueError('Invalid SAT>IP capability type')
 
     return SatIpDeviceInfo(
@@ -65,7 +98,72 @@ def fetch_satip_device_xml_descriptor(descriptor_url: str) -> SatIpDeviceInfo:
     )
 
 
-@dataclass
+def _parse_device_fields(descriptor_chunks: Iterable[bytes]) -> dict[str, str]:
+    """
+    Feeds the descriptor to expat and returns the text of the DEVICE_FIELD_TAGS found in root/device, keyed by tag. No
+    tree is built, and parsing stops after the chunk completing the last of them or root/device, so e.g. the icon and
+    service lists following them are usually never parsed. If a field occurs more than once, the first one is kept.
+    """
+    device_fields = {}
+    current_tag = None
+    # embedded devices in root/device/deviceList use the same tags, so only direct children of root/device are fields
+    depth = 0
+    in_root_device = False
+    root_device_done = False
+    parser = expat.ParserCreate(namespace_separator=' ')
+    # hand over an element's text in one piece, instead of split at every buffer boundary and entity
+    parser.buffer_text = True
+    parser.ordered_attributes = True
+
+    def start_element(name: str, _attributes: list[str]):
+        nonlocal current_tag, depth, in_root_device
+        depth += 1
+
+        if depth == 2:
+            # like the find() this replaced, only the first device element counts
+            in_root_device = name == TAG_DEVICE and not root_device_done
+        elif depth == 3 and in_root_device and name in DEVICE_FIELD_TAGS and name not in device_fields:
+            current_tag = name
+            device_fields[name] = ''
+
+    def character_data(data: str):
+        if current_tag:
+            device_fields[current_tag] += data
+
+    def end_element(_name: str):
+        nonlocal current_tag, depth, in_root_device, root_device_done
+
+        if depth == 2 and in_root_device:
+            in_root_device = False
+            root_device_done = True
+
+        depth -= 1
+        current_tag = None
+
+    parser.StartElementHandler = start_element
+    parser.CharacterDataHandler = character_data
+    parser.EndElementHandler = end_element
+
+    for chunk in descriptor_chunks:
+        parser.Parse(chunk, False)
+
+        if root_device_done or (current_tag is None and len(device_fields) == len(DEVICE_FIELD_TAGS)):
+            return device_fields
+
+    parser.Parse(b'', True)
+    return device_fields
+
+
+def _get_device_field(device_fields: dict[str, str], tag: str) -> str:
+    value = device_fields.get(tag)
+
+    if value is None:
+        raise ValueError(f'Invalid SAT>IP device descriptor, missing {tag.rpartition(" ")[2]}')
+
+    return value.strip()
+
+
+@dataclass(frozen=True, slots=True)
 class SatIpChannel:
     frontend: Optional[int]
     """
@@ -100,29 +198,48 @@ class SatIpChannel:
     """
     One of 0.35, 0.25, 0.20.
     """
-    pids: list[int]
+    pids: tuple[int, ...]
     display_name: Optional[str] = None
+    display_label: str = field(init=False, repr=False, compare=False)
+    """
+    Label to show for this channel in the UI, e.g. 10714.25/h|SomeName
+    """
+    _stream_uri_params: str = field(init=False, repr=False, compare=False)
 
     def __post_init__(self):
         if self.frontend is not None and (self.frontend < 1 or self.frontend > 65535):
             raise ValueError('Invalid frontend')
         if self.src < 1 or self.src > 255:
             raise ValueError('Invalid src')
-        if self.polarisation not in ['v', 'h']:
+        if self.polarisation not in VALID_POLARISATIONS:
             raise ValueError('Invalid polarity')
-        if self.modulation_system not in ['dvbs', 'dvbs2']:
+        if self.modulation_system not in VALID_MODULATION_SYSTEMS:
             raise ValueError('Invalid modulation_system')
-        if self.modulation_type not in ['qpsk', '8psk']:
+        if self.modulation_type not in VALID_MODULATION_TYPES:
             raise ValueError('Invalid modulation_type')
-        if self.fec not in [12, 23, 34, 56, 78, 89, 35, 45, 910]:
+        if self.fec not in VALID_FECS:
             raise ValueError('Invalid fec')
-        if self.rolloff not in [0.20, 0.25, 0.35]:
+        if self.rolloff not in VALID_ROLLOFFS:
             raise ValueError('Invalid rolloff')
-        for pid in self.pids:
-            if pid < 0 or pid > 8191:
-                raise ValueError('Invalid pid')
+        if min(self.pids, default=0) < 0 or max(self.pids, default=0) > 8191:
+            raise ValueError('Invalid pid')
+
+        # the channel is immutable, so derived strings only need to be built once
+        object.__setattr__(self, 'display_label', self._build_display_label())
+        object.__setattr__(self, '_stream_uri_params', self._build_stream_uri_params())
+
+    def to_stream_uri_params(self) -> str:
+        return self._stream_uri_params
+
+    def _build_display_label(self) -> str:
+        label = f'{self.frequency}/{self.polarisation}'
+
+        if self.display_name:
+            label += f'|{self.display_name}'
+
+        return label
 
-    def to_stream_uri_params(self):
+    def _build_stream_uri_params(self) -> str:
         result = (
             f'?src={self.src}'
             f'&freq={self.frequency}'
@@ -1,7 +1,21 @@
+import logging
 import sys
 
 
 def create_logger(sender: str):
-    def log(message: str):
-        print(f'({sender}) {message}', file=sys.stderr)
-    return log
\ No newline at end of file
+    """
+    Returns a function logging at info level for the given sender. It takes %-style arguments, which are only formatted
+    if the message is actually emitted.
+    """
+    return logging.getLogger(sender).info
+
+
+class StderrHandler(logging.StreamHandler):
+    """
+    Writes to whatever sys.stderr currently is, as Rich's Live display replaces it while running to keep log output
+    from breaking the display.
+    """
+
+    def emit(self, record: logging.LogRecord):
+        self.stream = sys.stderr
+        super().emit(record)
@@ -1,13 +1,16 @@
 import base64
 import unittest
 
-from src.rtcp import get_first_rtcp_app_packet_from_rtcp_data
+from src.rtcp import get_first_rtcp_app_packet_from_rtcp_data, get_first_rtcp_app_signal_from_rtcp_data
+
+
+RTCP_DATA = base64.b64decode('gMgABgCCerUAAAAAAAAAAIx7ggAAAABAAAE3YIHKAAYAgnq1ARFGRjpGRjpGRjpGRjpGRjpGRgCAzAAfAIJ6tVNFUzEAAABudmVyPTEuMDtzcmM9MTt0dW5lcj0xLDExNSwxLDEzLDEwNzE0LGgsZHZicyxxcHNrLG9mZiwwLjM1LDIyMDAwLDU2O3BpZHM9MCwxLDE2LDE3LDI2NiwyMzUzLDIzNTQsMjM1NSwyMzU2LDIzNTcAAA==')
 
 
 class TestRtcp(unittest.TestCase):
     def test_given_rtcp_data_returns_app_package(self):
         # given
-        rtcp_data = base64.b64decode('gMgABgCCerUAAAAAAAAAAIx7ggAAAABAAAE3YIHKAAYAgnq1ARFGRjpGRjpGRjpGRjpGRjpGRgCAzAAfAIJ6tVNFUzEAAABudmVyPTEuMDtzcmM9MTt0dW5lcj0xLDExNSwxLDEzLDEwNzE0LGgsZHZicyxxcHNrLG9mZiwwLjM1LDIyMDAwLDU2O3BpZHM9MCwxLDE2LDE3LDI2NiwyMzUzLDIzNTQsMjM1NSwyMzU2LDIzNTcAAA==')
+        rtcp_data = RTCP_DATA
 
         # when
         app_packet = get_first_rtcp_app_packet_from_rtcp_data(rtcp_data)
@@ -30,6 +33,50 @@ class TestRtcp(unittest.TestCase):
         assert app_packet.type == 'qpsk'
         assert app_packet.version == '1.0'
 
+    def test_given_rtcp_data_returns_app_signal(self):
+        # given
+        rtcp_data = RTCP_DATA
+
+        # when
+        app_signal = get_first_rtcp_app_signal_from_rtcp_data(rtcp_data)
+
+        # then
+        assert app_signal.signal_level == 115
+        assert app_signal.quality == 13
+
+    def test_given_rtcp_data_as_memoryview_returns_app_signal(self):
+        # given
+        rtcp_data = memoryview(bytearray(RTCP_DATA) + bytearray(16))[:len(RTCP_DATA)]
+
+        # when
+        app_signal = get_first_rtcp_app_signal_from_rtcp_data(rtcp_data)
+
+        # then
+        assert app_signal.signal_level == 115
+        assert app_signal.quality == 13
+
+    def test_given_rtcp_data_with_trailing_packet_returns_app_package(self):
+        # given
+        rtcp_bye = bytes.fromhex('81cb000100827ab5')
+        rtcp_data = RTCP_DATA + rtcp_bye
+
+        # when
+        app_packet = get_first_rtcp_app_packet_from_rtcp_data(rtcp_data)
+
+        # then
+        assert app_packet.signal_level == 115
+        assert app_packet.pids == [0, 1, 16, 17, 266, 2353, 2354, 2355, 2356, 2357]
+
+    def test_given_rtcp_data_without_app_package_returns_none(self):
+        # given
+        rtcp_data = RTCP_DATA[:28]
+
+        # when
+        app_signal = get_first_rtcp_app_signal_from_rtcp_data(rtcp_data)
+
+        # then
+        assert app_signal is None
+
 
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
@@ -0,0 +1,70 @@
+import os
+import sys
+import unittest
+
+# satip.py imports its siblings as top-level modules, the way main.py is run
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from satip import TAG_MANUFACTURER, TAG_MODEL_NAME, TAG_SATIPCAP, TAG_SERIAL_NUMBER, _parse_device_fields
+
+
+DESCRIPTOR_WITH_EMBEDDED_DEVICE = b'''<?xml version="1.0"?>
+<root xmlns="urn:schemas-upnp-org:device-1-0" xmlns:satip="urn:ses-com:satip">
+  <manufacturer>Outside</manufacturer>
+  <device>
+    <manufacturer>TopVendor</manufacturer>
+    <modelName>TopModel</modelName>
+    <deviceList>
+      <device>
+        <manufacturer>Embedded Inc</manufacturer>
+        <modelName>Sub</modelName>
+        <serialNumber>222</serialNumber>
+        <satip:X_SATIPCAP>DVBS2-2</satip:X_SATIPCAP>
+      </device>
+    </deviceList>
+    <serialNumber>111</serialNumber>
+    <satip:X_SATIPCAP>DVBS2-4</satip:X_SATIPCAP>
+    <serialNumber>333</serialNumber>
+  </device>
+</root>'''
+
+TOP_LEVEL_DEVICE_FIELDS = {
+    TAG_MANUFACTURER: 'TopVendor',
+    TAG_MODEL_NAME: 'TopModel',
+    TAG_SERIAL_NUMBER: '111',
+    TAG_SATIPCAP: 'DVBS2-4',
+}
+
+
+class TestSatIp(unittest.TestCase):
+    def test_given_embedded_device_in_one_chunk_returns_top_level_device_fields(self):
+        # given
+        descriptor_chunks = [DESCRIPTOR_WITH_EMBEDDED_DEVICE]
+
+        # when
+        device_fields = _parse_device_fields(descriptor_chunks)
+
+        # then
+        assert device_fields == TOP_LEVEL_DEVICE_FIELDS
+
+    def test_given_embedded_device_byte_by_byte_returns_top_level_device_fields(self):
+        # given
+        descriptor = DESCRIPTOR_WITH_EMBEDDED_DEVICE
+        descriptor_chunks = (descriptor[i:i + 1] for i in range(len(descriptor)))
+
+        # when
+        device_fields = _parse_device_fields(descriptor_chunks)
+
+        # then
+        assert device_fields == TOP_LEVEL_DEVICE_FIELDS
+
+    def test_given_field_outside_device_ignores_it(self):
+        # given
+        descriptor_chunks = [b'<root xmlns="urn:schemas-upnp-org:device-1-0"><manufacturer>Outside</manufacturer>'
+                             b'<device><modelName>TopModel</modelName></device></root>']
+
+        # when
+        device_fields = _parse_device_fields(descriptor_chunks)
+
+        # then
+        assert device_fields == {TAG_MODEL_NAME: 'TopModel'}